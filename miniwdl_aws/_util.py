@@ -1,54 +1,151 @@
 import os
+import time
+import functools
 import boto3
 import base64
 import json
-import uuid
 import requests
 import subprocess
+import threading
 from WDL._util import StructuredLogMessage as _
 
 
+# memoized results of AWS region detection; the EC2 instance metadata query additionally caches
+# its failure, so that hosts outside EC2 don't wait out its timeout on every call
+_REGION_CACHE = None
+_IMDS_UNAVAILABLE = object()
+_IMDS_REGION_CACHE = None
+# one pooled connection reused by the EC2 instance metadata token & region requests
+_IMDS_SESSION = requests.Session()
+_IMDS_SESSION.mount(
+    "http://169.254.169.254/", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1)
+)
+
+
 def detect_aws_region(cfg):
+    global _REGION_CACHE
     if cfg and cfg.has_option("aws", "region") and cfg.get("aws", "region"):
         return cfg.get("aws", "region")
 
+    if not _REGION_CACHE:
+        _REGION_CACHE = _detect_aws_region()
+    return _REGION_CACHE
+
+
+def _detect_aws_region():
     # check environment variables
     for ev in ("AWS_REGION", "AWS_DEFAULT_REGION"):
         if os.environ.get(ev):
             return os.environ[ev]
 
-    # check boto3, which will load ~/.aws
-    if boto3.DEFAULT_SESSION and boto3.DEFAULT_SESSION.region_name:
-        return boto3.DEFAULT_SESSION.region_name
-    session = boto3.Session()
+    # check boto3, which will load ~/.aws (reusing its default session, if it's been created)
+    session = boto3.DEFAULT_SESSION or boto3.Session()
     if session.region_name:
         return session.region_name
 
+    # query ECS container metadata, if we're in an ECS/Fargate task (where the EC2 metadata
+    # service may be blocked)
+    region = _ecs_region()
+    if region:
+        return region
+
     # query EC2 metadata
-    try:
-        return requests.get(
-            "http://169.254.169.254/latest/meta-data/placement/region", timeout=2.0
-        ).text
-    except:
-        pass
+    return _imds_region()
 
+
+def _ecs_region():
+    uri = os.environ.get("ECS_CONTAINER_METADATA_URI_V4") or os.environ.get(
+        "ECS_CONTAINER_METADATA_URI"
+    )
+    if uri:
+        try:
+            az = requests.get(uri + "/task", timeout=(0.2, 1.0)).json().get("AvailabilityZone")
+            if az and az[-1].isalpha():
+                return az[:-1]
+        except:
+            pass
     return None
 
 
+def _imds_region():
+    global _IMDS_REGION_CACHE
+    if os.environ.get("AWS_EC2_METADATA_DISABLED", "").lower() == "true":
+        # AWS-standard opt-out of EC2 instance metadata queries
+        return None
+    if _IMDS_REGION_CACHE is None:
+        try:
+            # short connect timeout to fail fast on hosts with no route to the metadata service
+            token = _imds_token()
+            response = _IMDS_SESSION.get(
+                "http://169.254.169.254/latest/meta-data/placement/region",
+                headers=({"X-aws-ec2-metadata-token": token} if token else {}),
+                timeout=(0.1, 1.0),
+            )
+            response.raise_for_status()
+            _IMDS_REGION_CACHE = response.text
+        except:
+            _IMDS_REGION_CACHE = _IMDS_UNAVAILABLE
+    if _IMDS_REGION_CACHE is _IMDS_UNAVAILABLE:
+        return None
+    return _IMDS_REGION_CACHE
+
+
+_IMDS_TOKEN_TTL = 21600
+_IMDS_TOKEN = None
+_IMDS_TOKEN_EXPIRY = 0.0
+
+
+def _imds_token():
+    # Get an IMDSv2 session token (required on instances enforcing IMDSv2), reusing it across
+    # metadata queries until shortly before it expires. Returns None if unavailable, in which case
+    # the caller may try IMDSv1.
+    global _IMDS_TOKEN, _IMDS_TOKEN_EXPIRY
+    if not _IMDS_TOKEN or time.time() >= _IMDS_TOKEN_EXPIRY:
+        _IMDS_TOKEN = None
+        try:
+            response = _IMDS_SESSION.put(
+                "http://169.254.169.254/latest/api/token",
+                headers={"X-aws-ec2-metadata-token-ttl-seconds": str(_IMDS_TOKEN_TTL)},
+                timeout=(0.1, 1.0),
+            )
+            response.raise_for_status()
+            _IMDS_TOKEN = response.text
+            _IMDS_TOKEN_EXPIRY = time.time() + _IMDS_TOKEN_TTL - 60
+        except (requests.exceptions.HTTPError, requests.exceptions.ReadTimeout):
+            # (as botocore does, since e.g. a container behind a hop limit of 1 receives no
+            # response to the token request, but may still reach IMDSv1)
+            pass
+    return _IMDS_TOKEN
+
+
 def randomize_job_name(job_name):
     # Append entropy to the Batch job name to avoid race condition using identical names in
     # concurrent RegisterJobDefinition requests
     return (
-        job_name[:103]  # 119 + 1 + 8 = 128
-        + "-"
-        + base64.b32encode(uuid.uuid4().bytes[:5]).lower().decode()
+        job_name[:103] + "-" + base64.b32encode(os.urandom(5)).lower().decode()  # 119 + 1 + 8 = 128
     )
 
 
-def efs_id_from_access_point(region_name, fsap_id):
+def _memoize_detection(detect):
+    # Memoize a detect_* helper on its arguments other than the logger, so that if a process
+    # initializes the plugin more than once, the AWS API queries aren't repeated. (Only the first
+    # call logs the detection results.)
+    cache = {}
+
+    @functools.wraps(detect)
+    def memoized(logger, *args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items())))
+        if key not in cache:
+            cache[key] = detect(logger, *args, **kwargs)
+        return cache[key]
+
+    return memoized
+
+
+def efs_id_from_access_point(region_name, fsap_id, boto_session=None):
     # Resolve the EFS access point id (fsap-xxxx) to the associated file system id (fs-xxxx). Saves
     # user from having to specify both.
-    aws_efs = boto3.Session().client("efs", region_name=region_name)
+    aws_efs = (boto_session or boto3.Session()).client("efs", region_name=region_name)
     desc = aws_efs.describe_access_points(AccessPointId=fsap_id)
     assert len(desc.get("AccessPoints", [])) == 1
     desc = desc["AccessPoints"][0]
@@ -57,6 +154,7 @@ def efs_id_from_access_point(region_name, fsap_id):
     return fs_id
 
 
+@_memoize_detection
 def detect_sagemaker_studio_efs(logger, **kwargs):
     # Detect if we're operating inside SageMaker Studio and if so, record EFS mount details
     METADATA_FILE = "/opt/ml/metadata/resource-metadata.json"
@@ -102,6 +200,7 @@ def detect_sagemaker_studio_efs(logger, **kwargs):
         return None
 
 
+@_memoize_detection
 def detect_studio_fsap(logger, efs_id, efs_uid, efs_home, **kwargs):
     # Look for an Access Point with the appropriate configuration to mount the SageMaker Studio EFS
     # (in the same way it's presented through Studio)
@@ -144,6 +243,7 @@ def detect_studio_fsap(logger, efs_id, efs_uid, efs_home, **kwargs):
         return None
 
 
+@_memoize_detection
 def detect_gwfcore_batch_queue(logger, efs_id, **kwargs):
     # Look for a Batch job queue tagged with the Studio EFS id (indicating it's our default)
     try:
@@ -193,22 +293,35 @@ def subprocess_run_with_clean_exit(*args, check=False, **kwargs):
 
     assert "timeout" not in kwargs
     with subprocess.Popen(*args, **kwargs) as subproc:
-        while True:
+        # communicate() in a background thread, while we wait for it on an Event (which remains
+        # interruptible by signal handlers, without polling)
+        outcome = {}
+        done = threading.Event()
+
+        def communicate():
             try:
-                stdout, stderr = subproc.communicate(timeout=0.1)
-                assert isinstance(subproc.returncode, int)
-                completed = subprocess.CompletedProcess(
-                    subproc.args, subproc.returncode, stdout, stderr
-                )
-                if check:
-                    completed.check_returncode()
-                return completed
-            except (SystemExit, KeyboardInterrupt, BrokenPipeError):
-                subproc.terminate()
-                subproc.communicate()
-                raise
-            except subprocess.TimeoutExpired:
-                pass
+                outcome["result"] = subproc.communicate()
+            except BaseException as exn:
+                outcome["error"] = exn
+            finally:
+                done.set()
+
+        communicator = threading.Thread(target=communicate, daemon=True)
+        communicator.start()
+        try:
+            done.wait()
+            if "error" in outcome:
+                raise outcome["error"]
+        except (SystemExit, KeyboardInterrupt, BrokenPipeError):
+            subproc.terminate()
+            communicator.join()
+            raise
+        stdout, stderr = outcome["result"]
+        assert isinstance(subproc.returncode, int)
+        completed = subprocess.CompletedProcess(subproc.args, subproc.returncode, stdout, stderr)
+        if check:
+            completed.check_returncode()
+        return completed
 
 
 END_OF_LOG = "[miniwdl_run_s3upload] -- END OF LOG --"
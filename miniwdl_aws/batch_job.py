@@ -6,10 +6,14 @@ workers.
 
 import os
 import math
+import json
+import atexit
+import hashlib
 import time
 import threading
-import heapq
+from collections import deque, defaultdict
 from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor, Future
 import boto3
 import botocore
 import WDL
@@ -26,6 +30,19 @@ from ._util import (
     detect_gwfcore_batch_queue,
 )
 
+# known AWS Batch job statuses => logger method for reporting a change to that status
+_JOB_STATUS_LOG_LEVELS = {
+    "SUBMITTED": "info",
+    "PENDING": "info",
+    "RUNNABLE": "info",
+    "STARTING": "info",
+    "RUNNING": "notice",
+    "SUCCEEDED": "notice",
+    "FAILED": "notice",
+}
+# statuses of a job that hasn't yet been placed on an instance
+_QUEUED_JOB_STATUSES = frozenset(("SUBMITTED", "PENDING", "RUNNABLE"))
+
 
 class BatchJob(WDL.runtime.task_container.TaskContainer):
     @classmethod
@@ -88,6 +105,12 @@ class BatchJob(WDL.runtime.task_container.TaskContainer):
             logger.warning(
                 "AWS BatchJob plugin recommends using EFS Access Point to simplify permissions between containers (configure [aws] fsap / MINIWDL__AWS__FSAP to fsap-xxxx)"
             )
+        # EFS volume & mount point for job definitions (the same for all tasks)
+        efs_volume_config = {"fileSystemId": cls._fs_id, "transitEncryption": "ENABLED"}
+        if cls._fsap_id:
+            efs_volume_config["authorizationConfig"] = {"accessPointId": cls._fsap_id}
+        cls._volumes = [{"name": "efs", "efsVolumeConfiguration": efs_volume_config}]
+        cls._mount_points = [{"containerPath": cls._fs_mount, "sourceVolume": "efs"}]
         logger.debug(
             _(
                 "AWS BatchJob EFS configuration",
@@ -110,10 +133,43 @@ class BatchJob(WDL.runtime.task_container.TaskContainer):
 
         # TODO: query Batch compute environment for resource limits
         cls._resource_limits = {"cpu": 64, "mem_bytes": 261992870916}
+        # botocore clients are thread-safe, so all tasks can share one (unlike Session objects)
+        boto3_retries = (
+            cfg.get_dict("aws", "boto3_retries")
+            if cfg.has_option("aws", "boto3_retries")
+            else {"max_attempts": 5, "mode": "standard"}
+        )
+        cls._aws_batch = boto3.Session().client(
+            "batch",
+            region_name=cls._region_name,
+            config=botocore.config.Config(retries=boto3_retries),
+        )
+        # read [aws] settings used repeatedly while submitting & polling jobs
+        cls._submit_period = cfg.get_float("aws", "submit_period")
+        cls._submit_period_b = (
+            cfg.get_float("aws", "submit_period_b")
+            if cfg.has_option("aws", "submit_period_b")
+            else 0.0
+        )
+        if cls._submit_period_b > 0.0:
+            cls._submit_period_c = cfg.get_float("aws", "submit_period_c")
+        cls._describe_period = cfg.get_float("aws", "describe_period")
+        cls._job_timeout = cfg.get_int("aws", "job_timeout")
+        cls._job_tags = cfg.get_dict("aws", "job_tags") if cfg.has_option("aws", "job_tags") else {}
+        if "AWS_BATCH_JOB_ID" in os.environ:
+            # If we find ourselves running inside an AWS Batch job, tag the new jobs identifying
+            # ourself as the "parent" job.
+            cls._job_tags["AWS_BATCH_PARENT_JOB_ID"] = os.environ["AWS_BATCH_JOB_ID"]
         cls._submit_lock = threading.Lock()
+        if not hasattr(cls, "_job_defs"):
+            # (once per process, so that job definitions registered before any re-initialization
+            # are still deregistered at exit)
+            cls._job_defs = {}  # container properties JSON => Future job definition handle
+            cls._job_defs_lock = threading.Lock()
+            atexit.register(cls._deregister_job_definitions, logger)
         cls._last_submit_time = [0.0]
         cls._init_time = time.time()
-        cls._describer = BatchJobDescriber()
+        cls._describer = BatchJobDescriber(cls._aws_batch, cls._describe_period, logger)
         logger.info(
             _(
                 "initialized AWS BatchJob plugin",
@@ -179,20 +235,11 @@ class BatchJob(WDL.runtime.task_container.TaskContainer):
         Run task
         """
         try:
-            boto3_retries = (
-                self.cfg.get_dict("aws", "boto3_retries")
-                if self.cfg.has_option("aws", "boto3_retries")
-                else {"max_attempts": 5, "mode": "standard"}
-            )
-            aws_batch = boto3.Session().client(  # Session() needed for thread safety
-                "batch",
-                region_name=self._region_name,
-                config=botocore.config.Config(retries=boto3_retries),
-            )
+            aws_batch = self._aws_batch
             with ExitStack() as cleanup:
-                # submit Batch job (with request throttling)
-                job_id = None
-                submit_period = self.cfg.get_float("aws", "submit_period")
+                # submit Batch job (with request throttling); the lock only guards reservation of
+                # our submission time slot, so that other threads needn't wait on our requests
+                submit_period = self._submit_period
                 while True:
                     with self._submit_lock:
                         if terminating():
@@ -201,10 +248,10 @@ class BatchJob(WDL.runtime.task_container.TaskContainer):
                             time.time() - self._last_submit_time[0]
                             >= submit_period * self._submit_period_multiplier()
                         ):
-                            job_id = self._submit_batch_job(logger, cleanup, aws_batch, command)
                             self._last_submit_time[0] = time.time()
                             break
                     time.sleep(submit_period / 4)
+                job_id = self._submit_batch_job(logger, aws_batch, command)
                 # poll Batch job status
                 return self._await_batch_job(logger, cleanup, aws_batch, job_id, terminating)
         except botocore.exceptions.ClientError as exn:
@@ -212,10 +259,10 @@ class BatchJob(WDL.runtime.task_container.TaskContainer):
             logger.error(wrapper)
             raise wrapper
 
-    def _submit_batch_job(self, logger, cleanup, aws_batch, command):
+    def _submit_batch_job(self, logger, aws_batch, command):
         """
-        Register & submit AWS batch job, leaving a cleanup callback to deregister the transient
-        job definition.
+        Submit AWS batch job, using a job definition shared with other tasks of the same image and
+        resource requirements, with the task command supplied through containerOverrides.
         """
 
         job_name = self.run_id
@@ -223,40 +270,21 @@ class BatchJob(WDL.runtime.task_container.TaskContainer):
             job_name = job_name[5:]
         if self.try_counter > 1:
             job_name += f"-try{self.try_counter}"
-        # Append entropy to the job name to avoid race condition using identical job names in
-        # concurrent RegisterJobDefinition requests
+        # Append entropy to the job name to distinguish retries & identically-named calls
         job_name = randomize_job_name(job_name)
 
         container_properties = self._prepare_container_properties(logger, command)
-        job_def = aws_batch.register_job_definition(
-            jobDefinitionName=job_name,
-            type="container",
-            containerProperties=container_properties,
-        )
-        job_def_handle = f"{job_def['jobDefinitionName']}:{job_def['revision']}"
-        logger.debug(
-            _(
-                "registered Batch job definition",
-                jobDefinition=job_def_handle,
-                **container_properties,
-            )
-        )
-
-        self._cleanup_job_definition(logger, cleanup, aws_batch, job_def_handle)
+        container_overrides = {"command": container_properties.pop("command")}
+        job_def_handle = self._job_definition(logger, aws_batch, container_properties)
 
-        job_tags = {}
-        if self.cfg.has_option("aws", "job_tags"):
-            job_tags = self.cfg.get_dict("aws", "job_tags")
-        if "AWS_BATCH_JOB_ID" in os.environ:
-            # If we find ourselves running inside an AWS Batch job, tag the new job identifying
-            # ourself as the "parent" job.
-            job_tags["AWS_BATCH_PARENT_JOB_ID"] = os.environ["AWS_BATCH_JOB_ID"]
+        job_tags = self._job_tags
         # TODO: set a tag to indicate that this job is a retry of another
         job = aws_batch.submit_job(
             jobName=job_name,
             jobQueue=self._job_queue,
             jobDefinition=job_def_handle,
-            timeout={"attemptDurationSeconds": self.cfg.get_int("aws", "job_timeout")},
+            containerOverrides=container_overrides,
+            timeout={"attemptDurationSeconds": self._job_timeout},
             tags=job_tags,
         )
         logger.info(
@@ -320,52 +348,103 @@ class BatchJob(WDL.runtime.task_container.TaskContainer):
         command/stdout/stderr files.
         """
 
-        # prepare control files
-        with open(os.path.join(self.host_dir, "command"), "w") as outfile:
-            outfile.write(command)
-        with open(self.host_stdout_txt(), "w"):
-            pass
-        with open(self.host_stderr_txt(), "w"):
-            pass
-
-        # EFS mount point
-        volumes = [
-            {
-                "name": "efs",
-                "efsVolumeConfiguration": {
-                    "fileSystemId": self._fs_id,
-                    "transitEncryption": "ENABLED",
-                },
-            }
-        ]
-        if self._fsap_id:
-            volumes[0]["efsVolumeConfiguration"]["authorizationConfig"] = {
-                "accessPointId": self._fsap_id
-            }
-        mount_points = [{"containerPath": self._fs_mount, "sourceVolume": "efs"}]
+        # prepare control files (using low-level I/O to minimize EFS operations)
+        for fn, contents in (
+            (os.path.join(self.host_dir, "command"), command.encode()),
+            (self.host_stdout_txt(), b""),
+            (self.host_stderr_txt(), b""),
+        ):
+            fd = os.open(fn, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+            try:
+                contents = memoryview(contents)
+                while contents:
+                    contents = contents[os.write(fd, contents) :]
+            finally:
+                os.close(fd)
 
+        volumes, mount_points = self._volumes, self._mount_points
         if self._inputs_copied:
             return volumes, mount_points
 
-        # Prepare symlinks to the input Files & Directories
+        # Prepare symlinks to the input Files & Directories, grouped by parent directory so that
+        # we make each directory once
         container_prefix = os.path.join(self.container_dir, "work/_miniwdl_inputs/")
-        link_dirs_made = set()
+        links_by_dir = defaultdict(list)
         for host_fn, container_fn in self.input_path_map.items():
             assert container_fn.startswith(container_prefix) and len(container_fn) > len(
                 container_prefix
             )
-            link_dn = os.path.dirname(container_fn)
-            if link_dn not in link_dirs_made:
-                os.makedirs(link_dn)
-                link_dirs_made.add(link_dn)
-            symlink_force(host_fn, container_fn)
+            links_by_dir[os.path.dirname(container_fn)].append((host_fn, container_fn))
+        for link_dn in links_by_dir:
+            os.makedirs(link_dn, exist_ok=True)
+        links = [link for dir_links in links_by_dir.values() for link in dir_links]
+        if len(links) > 64:
+            # Each symlink is a synchronous metadata round trip to EFS, so keep many in flight when
+            # there are lots of them
+            with ThreadPoolExecutor(max_workers=32) as pool:
+                for future in [pool.submit(symlink_force, *link) for link in links]:
+                    future.result()
+        else:
+            for host_fn, container_fn in links:
+                symlink_force(host_fn, container_fn)
 
         return volumes, mount_points
 
-    def _cleanup_job_definition(self, logger, cleanup, aws_batch, job_def_handle):
-        def deregister(logger, aws_batch, job_def_handle):
+    def _job_definition(self, logger, aws_batch, container_properties):
+        """
+        Get the handle of a job definition with the given container properties, registering it if
+        we haven't already done so in this process
+        """
+        key = json.dumps(container_properties, sort_keys=True)
+        with self._job_defs_lock:
+            job_def_future = self._job_defs.get(key, None)
+            registering = job_def_future is None
+            if registering:
+                job_def_future = self._job_defs[key] = Future()
+        if not registering:
+            # registered, or being registered by another thread (whose error we'd also raise)
+            return job_def_future.result()
+
+        try:
+            # Append entropy to the name to avoid race condition using identical names in
+            # concurrent RegisterJobDefinition requests from other processes
+            job_def = aws_batch.register_job_definition(
+                jobDefinitionName=randomize_job_name(
+                    "miniwdl_" + hashlib.sha256(key.encode()).hexdigest()[:16]
+                ),
+                type="container",
+                containerProperties=container_properties,
+            )
+        except BaseException as exn:
+            # let a later task retry
+            with self._job_defs_lock:
+                del self._job_defs[key]
+            job_def_future.set_exception(exn)
+            raise
+        job_def_handle = f"{job_def['jobDefinitionName']}:{job_def['revision']}"
+        logger.debug(
+            _(
+                "registered Batch job definition",
+                jobDefinition=job_def_handle,
+                **container_properties,
+            )
+        )
+        job_def_future.set_result(job_def_handle)
+        return job_def_handle
+
+    @classmethod
+    def _deregister_job_definitions(cls, logger):
+        # deregister job definitions at process exit
+        with cls._job_defs_lock:
+            job_defs = [
+                job_def_future.result()
+                for job_def_future in cls._job_defs.values()
+                if job_def_future.done() and not job_def_future.exception()
+            ]
+            cls._job_defs.clear()
+        for job_def_handle in job_defs:
             try:
-                aws_batch.deregister_job_definition(jobDefinition=job_def_handle)
+                cls._aws_batch.deregister_job_definition(jobDefinition=job_def_handle)
                 logger.debug(_("deregistered Batch job definition", jobDefinition=job_def_handle))
             except botocore.exceptions.ClientError as exn:
                 # AWS expires job definitions after 6mo, so failing to delete them isn't fatal
@@ -377,13 +456,11 @@ class BatchJob(WDL.runtime.task_container.TaskContainer):
                     )
                 )
 
-        cleanup.callback(deregister, logger, aws_batch, job_def_handle)
-
     def _await_batch_job(self, logger, cleanup, aws_batch, job_id, terminating):
         """
         Poll for Batch job success or failure & return exit code
         """
-        describe_period = self.cfg.get_float("aws", "describe_period")
+        describe_period = self._describe_period
         cleanup.callback((lambda job_id: self._describer.unsubscribe(job_id)), job_id)
         poll_stderr = cleanup.enter_context(
             PygtailLogger(logger, self.host_stderr_txt(), callback=self.stderr_callback)
@@ -391,17 +468,14 @@ class BatchJob(WDL.runtime.task_container.TaskContainer):
         exit_code = None
         while exit_code is None:
             time.sleep(describe_period)
-            job_desc = self._describer.describe(aws_batch, job_id, describe_period)
+            job_desc = self._describer.describe(job_id)
             job_status = job_desc["status"]
             if "container" in job_desc and "logStreamName" in job_desc["container"]:
                 self._logStreamName = job_desc["container"]["logStreamName"]
             if job_status not in self._observed_states:
                 self._observed_states.add(job_status)
-                logfn = (
-                    logger.notice
-                    if job_status in ("RUNNING", "SUCCEEDED", "FAILED")
-                    else logger.info
-                )
+                log_level = _JOB_STATUS_LOG_LEVELS.get(job_status, None)
+                logfn = getattr(logger, log_level or "info")
                 logdetails = {"status": job_status, "jobId": job_id}
                 if self._logStreamName:
                     logdetails["logStreamName"] = self._logStreamName
@@ -416,15 +490,7 @@ class BatchJob(WDL.runtime.task_container.TaskContainer):
                             self.runtime_values.get("memory_reservation", 0),
                         )
                     )
-                if job_status not in (
-                    "SUBMITTED",
-                    "PENDING",
-                    "RUNNABLE",
-                    "STARTING",
-                    "RUNNING",
-                    "SUCCEEDED",
-                    "FAILED",
-                ):
+                if not log_level:
                     logger.warning(_("unknown job status from AWS Batch", status=job_status))
             if job_status == "SUCCEEDED":
                 exit_code = 0
@@ -454,7 +520,7 @@ class BatchJob(WDL.runtime.task_container.TaskContainer):
             if terminating():
                 aws_batch.terminate_job(jobId=job_id, reason="terminated by miniwdl")
                 raise WDL.runtime.Terminated(
-                    quiet=not self._observed_states.difference({"SUBMITTED", "PENDING", "RUNNABLE"})
+                    quiet=self._observed_states.issubset(_QUEUED_JOB_STATUSES)
                 )
         for _root, _dirs, _files in os.walk(self.host_dir, followlinks=False):
             # no-op traversal of working directory to refresh NFS metadata cache (speculative)
@@ -464,15 +530,10 @@ class BatchJob(WDL.runtime.task_container.TaskContainer):
 
     def _submit_period_multiplier(self):
         if self._describer.jobs:
-            b = (
-                self.cfg.get_float("aws", "submit_period_b")
-                if self.cfg.has_option("aws", "submit_period_b")
-                else 0.0
-            )
+            b = self._submit_period_b
             if b > 0.0:
                 t = time.time() - self._init_time
-                c = self.cfg.get_float("aws", "submit_period_c")
-                return max(1.0, c - t / b)
+                return max(1.0, self._submit_period_c - t / b)
         return 1.0
 
 
@@ -480,35 +541,44 @@ class BatchJobDescriber:
     """
     This singleton object handles calling the AWS Batch DescribeJobs API with up to 100 job IDs
     per request, then dispensing each job description to the thread interested in it. This helps
-    avoid AWS API request rate limits when we're tracking many concurrent jobs.
+    avoid AWS API request rate limits when we're tracking many concurrent jobs. The requests are
+    made by one background thread, at most once per period, so the task threads only wait for
+    their job descriptions to arrive.
     """
 
     JOBS_PER_REQUEST = 100  # maximum jobs per DescribeJob request
+    MAX_FAILURES = 10  # consecutive failures to describe a job before passing on the error
 
-    def __init__(self):
+    def __init__(self, aws_batch, period, logger):
+        self.aws_batch = aws_batch
+        self.period = period
+        self.logger = logger
         self.lock = threading.Lock()
-        self.last_request_time = 0
-        self.job_queue = []
+        self.cond = threading.Condition(self.lock)  # notified upon new job & each update
+        self.job_queue = deque()  # job IDs, least-recently described first
         self.jobs = {}
+        self.failures = {}  # job ID => consecutive failures to describe it
+        self.thread = threading.Thread(target=self._update_loop, daemon=True)
+        self.thread.start()
 
-    def describe(self, aws_batch, job_id, period):
+    def describe(self, job_id):
         """
         Get the latest Batch job description
         """
-        while True:
-            with self.lock:
-                if job_id not in self.jobs:
-                    # register new job to be described ASAP
-                    heapq.heappush(self.job_queue, (0.0, job_id))
-                    self.jobs[job_id] = None
-                # update as many job descriptions as possible
-                self._update(aws_batch, period)
-                # return the desired job description if we have it
-                desc = self.jobs[job_id]
-                if desc:
-                    return desc
-            # otherwise wait (outside the lock) and try again
-            time.sleep(period / 4)
+        with self.lock:
+            if job_id not in self.jobs:
+                # register new job to be described ASAP
+                self.job_queue.appendleft(job_id)
+                self.jobs[job_id] = None
+                self.cond.notify_all()
+            # wait (releasing the lock) until we have the desired job description
+            while not self.jobs[job_id]:
+                self.cond.wait()
+            desc = self.jobs[job_id]
+            if isinstance(desc, Exception):
+                # DescribeJobs failed for this job (persistently, if we'd described it before)
+                raise desc
+            return desc
 
     def unsubscribe(self, job_id):
         """
@@ -517,33 +587,63 @@ class BatchJobDescriber:
         with self.lock:
             if job_id in self.jobs:
                 del self.jobs[job_id]
+            self.failures.pop(job_id, None)
 
-    def _update(self, aws_batch, period):
-        # if enough time has passed since our last DescribeJobs request
-        if time.time() - self.last_request_time >= period:
-            # take the N least-recently described jobs
-            job_ids = set()
-            assert self.job_queue
+    def _update_loop(self):
+        while True:
+            with self.lock:
+                while not self.jobs:
+                    self.cond.wait()
+            try:
+                self._update()
+            except Exception as exn:
+                # keep this thread alive, since the task threads wait on it
+                self.logger.error(_("unexpected error describing AWS Batch jobs", error=repr(exn)))
+            time.sleep(self.period)
+
+    def _update(self):
+        # take the N least-recently described jobs, and re-enqueue them for next time
+        job_ids = set()
+        with self.lock:
             while self.job_queue and len(job_ids) < self.JOBS_PER_REQUEST:
-                job_id = heapq.heappop(self.job_queue)[1]
-                assert job_id not in job_ids
+                job_id = self.job_queue.popleft()
                 if job_id in self.jobs:
                     job_ids.add(job_id)
-            if not job_ids:
-                return
-            # describe them
-            try:
-                job_descs = aws_batch.describe_jobs(jobs=list(job_ids))
-            finally:
-                # always: bump last_request_time and re-enqueue these jobs
-                self.last_request_time = time.time()
-                for job_id in job_ids:
-                    heapq.heappush(self.job_queue, (self.last_request_time, job_id))
-            # update self.jobs with the new descriptions
-            for job_desc in job_descs["jobs"]:
-                job_ids.remove(job_desc["jobId"])
-                self.jobs[job_desc["jobId"]] = job_desc
-            assert not job_ids, "AWS Batch DescribeJobs didn't return all expected results"
+            self.job_queue.extend(job_ids)
+        if not job_ids:
+            return
+        # describe them (outside the lock)
+        try:
+            response = self.aws_batch.describe_jobs(jobs=list(job_ids))
+            job_descs = dict((job_desc["jobId"], job_desc) for job_desc in response["jobs"])
+            error = AssertionError("AWS Batch DescribeJobs didn't return all expected results")
+        except Exception as exn:
+            job_descs = {}
+            error = exn
+        # update self.jobs with the new descriptions
+        with self.lock:
+            stale = 0
+            for job_id in job_ids:
+                if job_id not in self.jobs:  # unsubscribed in the meantime
+                    continue
+                if job_id in job_descs:
+                    self.jobs[job_id] = job_descs[job_id]
+                    self.failures.pop(job_id, None)
+                    continue
+                self.failures[job_id] = self.failures.get(job_id, 0) + 1
+                if self.jobs[job_id] is None or self.failures[job_id] >= self.MAX_FAILURES:
+                    # we've never described this job, or have repeatedly failed to; pass the error
+                    # on to the thread awaiting it (as the thread making the request would have
+                    # raised it)
+                    self.jobs[job_id] = error
+                else:
+                    # keep the last description and retry on the next request
+                    stale += 1
+            self.cond.notify_all()
+        if stale:
+            self.logger.warning(
+                _("AWS Batch DescribeJobs failed; will retry", error=str(error), jobs=stale)
+            )
 
 
 class AWSError(WDL.Error.RuntimeError):
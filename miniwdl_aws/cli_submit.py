@@ -8,14 +8,36 @@ stream its logs.
 
 import sys
 import os
+import re
 import time
 import argparse
+import collections
+import functools
 import shlex
-from datetime import datetime
-from collections import defaultdict
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import boto3
+import botocore
 from ._util import detect_aws_region, randomize_job_name, END_OF_LOG, efs_id_from_access_point
 
+# MINIWDL__* environment variables excluded from pass-through to the workflow job
+_EXCLUDED_ENV = frozenset(
+    (
+        "MINIWDL__AWS__FS",
+        "MINIWDL__AWS__FSAP",
+        "MINIWDL__AWS__TASK_QUEUE",
+        "MINIWDL__AWS__WORKFLOW_QUEUE",
+        "MINIWDL__AWS__WORKFLOW_ROLE",
+        "MINIWDL__AWS__WORKFLOW_IMAGE",
+        "MINIWDL__AWS__WORKFLOW_JOBDEF",
+        "MINIWDL__AWS__S3_UPLOAD_FOLDER",
+        "MINIWDL__AWS__S3_UPLOAD_DELETE_AFTER",
+        "MINIWDL__FILE_IO__ROOT",
+    )
+)
+_JOB_NAME_STOP = re.compile(r"[.?]")
+
 
 def miniwdl_submit_awsbatch(argv):
     # Configure from arguments & environment
@@ -31,111 +53,242 @@ def miniwdl_submit_awsbatch(argv):
             file=sys.stderr,
         )
         sys.exit(1)
-    aws_batch = boto3.client("batch", region_name=aws_region_name)
-    if not args.workflow_role:
+    # one boto3 session shared by all our clients, so that they share loaded service models and
+    # resolved credentials
+    boto_session = boto3.Session(region_name=aws_region_name)
+    aws_batch = boto_session.client("batch")
+    if not args.workflow_role and not args.job_definition:
         args.workflow_role = detect_workflow_role(aws_batch, args.workflow_queue, verbose)
-    fs_id = efs_id_from_access_point(aws_region_name, args.fsap)
+    fs_id = efs_id_from_access_point(aws_region_name, args.fsap, boto_session)
 
     # Prepare workflow job: command, environment, and container properties
     job_name, miniwdl_run_cmd = form_miniwdl_run_cmd(args, unused_args)
     job_name = randomize_job_name(job_name)
 
-    environment = [
-        {"name": "MINIWDL__AWS__FS", "value": fs_id},
-        {"name": "MINIWDL__AWS__FSAP", "value": args.fsap},
-        {"name": "MINIWDL__AWS__TASK_QUEUE", "value": args.task_queue},
-        {"name": "MINIWDL__FILE_IO__ROOT", "value": args.mount},
-    ]
-    extra_env = set()
-    if not args.no_env:
-        # pass through environment variables starting with MINIWDL__ (except those specific to
-        # workflow job launch, or passed through via command line)
-        for k in os.environ:
-            if k.startswith("MINIWDL__") and k not in (
-                "MINIWDL__AWS__FS",
-                "MINIWDL__AWS__FSAP",
-                "MINIWDL__AWS__TASK_QUEUE",
-                "MINIWDL__AWS__WORKFLOW_QUEUE",
-                "MINIWDL__AWS__WORKFLOW_ROLE",
-                "MINIWDL__AWS__WORKFLOW_IMAGE",
-                "MINIWDL__AWS__S3_UPLOAD_FOLDER",
-                "MINIWDL__AWS__S3_UPLOAD_DELETE_AFTER",
-                "MINIWDL__FILE_IO__ROOT",
-            ):
-                environment.append({"name": k, "value": os.environ[k]})
-                extra_env.add(k)
+    # pass through environment variables starting with MINIWDL__ (except those specific to
+    # workflow job launch, or passed through via command line)
+    extra_env = (
+        []
+        if args.no_env
+        else [
+            (k, v)
+            for k, v in os.environ.items()
+            if k.startswith("MINIWDL__") and k not in _EXCLUDED_ENV
+        ]
+    )
+    # keyed by name so that each variable appears once, with the base settings authoritative
+    environment = dict(extra_env)
+    environment.update(
+        (
+            ("MINIWDL__AWS__FS", fs_id),
+            ("MINIWDL__AWS__FSAP", args.fsap),
+            ("MINIWDL__AWS__TASK_QUEUE", args.task_queue),
+            ("MINIWDL__FILE_IO__ROOT", args.mount),
+        )
+    )
+    environment = [{"name": k, "value": v} for k, v in environment.items()]
 
     if verbose:
-        print("Image: " + args.image, file=sys.stderr)
+        if args.job_definition:
+            print("Job definition: " + args.job_definition, file=sys.stderr)
+        else:
+            print("Image: " + args.image, file=sys.stderr)
         if extra_env:
             print(
                 "Passing through environment variables (--no-env to disable): "
-                + " ".join(list(extra_env)),
+                + " ".join(k for k, _ in extra_env),
                 file=sys.stderr,
             )
         print("Invocation: " + " ".join(shlex.quote(s) for s in miniwdl_run_cmd), file=sys.stderr)
 
-    workflow_container_props = {
-        "fargatePlatformConfiguration": {"platformVersion": "1.4.0"},
-        "executionRoleArn": args.workflow_role,
-        "jobRoleArn": args.workflow_role,
-        "resourceRequirements": [
-            {"type": "VCPU", "value": str(args.cpu)},
-            {"type": "MEMORY", "value": str(args.memory_GiB * 1024)},
-        ],
-        "volumes": [
-            {
-                "name": "efs",
-                "efsVolumeConfiguration": {
-                    "fileSystemId": fs_id,
-                    "transitEncryption": "ENABLED",
-                    "authorizationConfig": {"accessPointId": args.fsap},
-                },
-            }
-        ],
-        "mountPoints": [{"containerPath": args.mount, "sourceVolume": "efs"}],
-        "image": args.image,
-        "command": miniwdl_run_cmd,
-        "environment": environment,
-    }
-    if not args.no_public_ip:
-        workflow_container_props["networkConfiguration"] = {"assignPublicIp": "ENABLED"}
-
-    # Register & submit workflow job
-    workflow_job_def = aws_batch.register_job_definition(
-        jobDefinitionName=job_name,
-        platformCapabilities=["FARGATE"],
-        type="container",
-        containerProperties=workflow_container_props,
-    )
-    workflow_job_def_handle = (
-        f"{workflow_job_def['jobDefinitionName']}:{workflow_job_def['revision']}"
-    )
-    try:
+    resource_requirements = [
+        {"type": "VCPU", "value": str(args.cpu)},
+        {"type": "MEMORY", "value": str(args.memory_GiB * 1024)},
+    ]
+    if args.job_definition:
+        # Submit workflow job using the given (reusable) job definition, overriding the settings
+        # specific to this workflow
         workflow_job_id = aws_batch.submit_job(
             jobName=job_name,
             jobQueue=args.workflow_queue,
-            jobDefinition=workflow_job_def_handle,
+            jobDefinition=args.job_definition,
+            containerOverrides={
+                "command": miniwdl_run_cmd,
+                "environment": environment,
+                "resourceRequirements": resource_requirements,
+            },
         )["jobId"]
-        if verbose:
-            print(f"Submitted {job_name} to {args.workflow_queue}:", file=sys.stderr)
-            sys.stderr.flush()
-        print(workflow_job_id)
-        if not sys.stdout.isatty():
-            print(workflow_job_id, file=sys.stderr)
-    finally:
-        aws_batch.deregister_job_definition(jobDefinition=workflow_job_def_handle)
+    else:
+        workflow_container_props = {
+            "fargatePlatformConfiguration": {"platformVersion": "1.4.0"},
+            "executionRoleArn": args.workflow_role,
+            "jobRoleArn": args.workflow_role,
+            "resourceRequirements": resource_requirements,
+            "volumes": [
+                {
+                    "name": "efs",
+                    "efsVolumeConfiguration": {
+                        "fileSystemId": fs_id,
+                        "transitEncryption": "ENABLED",
+                        "authorizationConfig": {"accessPointId": args.fsap},
+                    },
+                }
+            ],
+            "mountPoints": [{"containerPath": args.mount, "sourceVolume": "efs"}],
+            "image": args.image,
+            "command": miniwdl_run_cmd,
+            "environment": environment,
+        }
+        if not args.no_public_ip:
+            workflow_container_props["networkConfiguration"] = {"assignPublicIp": "ENABLED"}
+
+        # Register & submit workflow job, then deregister the transient job definition (even if
+        # interrupted in between)
+        workflow_job_def_handle = None
+        try:
+            workflow_job_def = aws_batch.register_job_definition(
+                jobDefinitionName=job_name,
+                platformCapabilities=["FARGATE"],
+                type="container",
+                containerProperties=workflow_container_props,
+            )
+            workflow_job_def_handle = (
+                f"{workflow_job_def['jobDefinitionName']}:{workflow_job_def['revision']}"
+            )
+            workflow_job_id = aws_batch.submit_job(
+                jobName=job_name,
+                jobQueue=args.workflow_queue,
+                jobDefinition=workflow_job_def_handle,
+            )["jobId"]
+        finally:
+            if workflow_job_def_handle:
+                aws_batch.deregister_job_definition(jobDefinition=workflow_job_def_handle)
+    if verbose:
+        print(f"Submitted {job_name} to {args.workflow_queue}:", file=sys.stderr)
+        sys.stderr.flush()
+    line = workflow_job_id + "\n"
+    sys.stdout.write(line)
+    if not sys.stdout.isatty():
+        sys.stderr.write(line)
 
     # Wait for workflow job, if requested
     exit_code = 0
     if args.wait or args.follow:
-        exit_code = wait(aws_region_name, aws_batch, workflow_job_id, args.follow)
+        exit_code = wait(
+            boto_session,
+            aws_batch,
+            workflow_job_id,
+            args.follow,
+            args.poll_interval,
+            live_tail=args.live_tail,
+        )
     sys.exit(exit_code)
 
 
 def parse_args_and_env(argv):
     if "COLUMNS" not in os.environ:
         os.environ["COLUMNS"] = "100"
+    parser = build_parser()
+
+    # Parse command line
+    args, unused_args = parser.parse_known_args(argv[1:])
+
+    args.mount = args.mount.rstrip("/")
+    assert args.mount
+    if not args.dir:
+        args.dir = os.path.join(args.mount, "miniwdl_run")
+    if not args.dir.startswith(args.mount):
+        print(f"--dir must begin with {args.mount}", file=sys.stderr)
+        sys.exit(1)
+
+    # Detect additional configuration from environment
+    args.fsap = args.fsap if args.fsap else os.environ.get("MINIWDL__AWS__FSAP", "")
+    args.workflow_queue = (
+        args.workflow_queue
+        if args.workflow_queue
+        else os.environ.get("MINIWDL__AWS__WORKFLOW_QUEUE", None)
+    )
+    args.task_queue = (
+        args.task_queue if args.task_queue else os.environ.get("MINIWDL__AWS__TASK_QUEUE", None)
+    )
+    if not (args.fsap.startswith("fsap-") and args.workflow_queue and args.task_queue):
+        print(
+            "--fsap, --workflow-queue, and --task-queue all required (or environment variables MINIWDL__AWS__FSAP, MINIWDL__AWS__WORKFLOW_QUEUE, MINIWDL__AWS__TASK_QUEUE)",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+    args.job_definition = (
+        args.job_definition
+        if args.job_definition
+        else os.environ.get("MINIWDL__AWS__WORKFLOW_JOBDEF", None)
+    )
+    if args.job_definition:
+        # the job definition sets the image, role, and network configuration, which we can't
+        # override at submission
+        conflicting = [
+            flag
+            for flag, given in (
+                ("--image", args.image),
+                ("--workflow-role", args.workflow_role),
+                ("--no-public-ip", args.no_public_ip),
+            )
+            if given
+        ]
+        if conflicting:
+            print(
+                "can't use "
+                + " or ".join(conflicting)
+                + " with --job-definition; set the corresponding properties in the job definition"
+                " instead",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        for ev in ("MINIWDL__AWS__WORKFLOW_IMAGE", "MINIWDL__AWS__WORKFLOW_ROLE"):
+            if os.environ.get(ev):
+                print(
+                    f"[miniwdl-aws-submit] WARNING: ignoring environment {ev} with --job-definition",
+                    file=sys.stderr,
+                )
+    else:
+        args.workflow_role = (
+            args.workflow_role
+            if args.workflow_role
+            else os.environ.get("MINIWDL__AWS__WORKFLOW_ROLE", None)
+        )
+        args.image = (
+            args.image if args.image else os.environ.get("MINIWDL__AWS__WORKFLOW_IMAGE", None)
+        )
+        if not args.image:
+            args.image = default_image()
+            if not args.image:
+                print(
+                    "Failed to detect miniwdl Docker image version tag; set explicitly with --image or MINIWDL__AWS__WORKFLOW_IMAGE",
+                    file=sys.stderr,
+                )
+                sys.exit(1)
+    if args.delete_after and not args.s3upload:
+        print("--delete-after requires --s3upload", file=sys.stderr)
+        sys.exit(1)
+    if not args.poll_interval > 0:
+        print("--poll-interval must be positive", file=sys.stderr)
+        sys.exit(1)
+    args.s3upload = (
+        args.s3upload if args.s3upload else os.environ.get("MINIWDL__AWS__S3_UPLOAD_FOLDER", None)
+    )
+    args.delete_after = (
+        args.delete_after.strip().lower()
+        if args.delete_after
+        else os.environ.get("MINIWDL__AWS__DELETE_AFTER_S3_UPLOAD", None)
+    )
+
+    return (args, unused_args)
+
+
+@functools.lru_cache(maxsize=None)
+def build_parser():
+    """
+    Build the command-line argument parser (memoized, since parsing doesn't modify it)
+    """
     parser = argparse.ArgumentParser(
         prog="miniwdl-aws-submit",
         description="Launch `miniwdl run` on AWS Batch (+ EFS at /mnt/efs), itself launching additional"
@@ -165,6 +318,13 @@ def parse_args_and_env(argv):
         help="ARN of execution+job role for workflow job [env MINIWDL__AWS__WORKFLOW_ROLE"
         " or read from WorkflowEngineRoleArn tag on job queue]",
     )
+    group.add_argument(
+        "--job-definition",
+        help="existing Batch job definition to use for the workflow job, instead of registering a"
+        " transient one; it must set the image, role, EFS mount, and network configuration, since"
+        " only the command, environment, and resources are overridden (so --image,"
+        " --workflow-role, and --no-public-ip don't apply) [env MINIWDL__AWS__WORKFLOW_JOBDEF]",
+    )
     group.add_argument("--name", help="workflow job name [WDL filename]")
     group.add_argument("--cpu", metavar="N", type=int, default=2, help="vCPUs for workflow job [2]")
     group.add_argument(
@@ -206,68 +366,37 @@ def parse_args_and_env(argv):
         action="store_true",
         help="live-stream workflow log to standard error (implies --wait)",
     )
-    parser.add_argument("--self-test", action="store_true", help="perform `miniwdl run_self_test`")
-
-    # Parse command line
-    args, unused_args = parser.parse_known_args(argv[1:])
-
-    if args.mount.endswith("/"):
-        args.mount = args.mount[:-1]
-    assert args.mount
-    if not args.dir:
-        args.dir = os.path.join(args.mount, "miniwdl_run")
-    if not args.dir.startswith(args.mount):
-        print(f"--dir must begin with {args.mount}", file=sys.stderr)
-        sys.exit(1)
-
-    # Detect additional configuration from environment
-    args.fsap = args.fsap if args.fsap else os.environ.get("MINIWDL__AWS__FSAP", "")
-    args.workflow_queue = (
-        args.workflow_queue
-        if args.workflow_queue
-        else os.environ.get("MINIWDL__AWS__WORKFLOW_QUEUE", None)
-    )
-    args.task_queue = (
-        args.task_queue if args.task_queue else os.environ.get("MINIWDL__AWS__TASK_QUEUE", None)
+    parser.add_argument(
+        "--live-tail",
+        action="store_true",
+        help="with --follow, receive the log through a CloudWatch Logs Live Tail session instead of"
+        " polling (billed per session-minute; requires logs:StartLiveTail and"
+        " logs:DescribeLogGroups permissions)",
     )
-    args.workflow_role = (
-        args.workflow_role
-        if args.workflow_role
-        else os.environ.get("MINIWDL__AWS__WORKFLOW_ROLE", None)
+    parser.add_argument(
+        "--poll-interval",
+        metavar="SECONDS",
+        type=float,
+        default=1.0,
+        help="initial interval for polling workflow job status, which backs off while the status is"
+        " unchanged; also the interval for printing new log messages with --follow [1.0]",
     )
-    if not (args.fsap.startswith("fsap-") and args.workflow_queue and args.task_queue):
-        print(
-            "--fsap, --workflow-queue, and --task-queue all required (or environment variables MINIWDL__AWS__FSAP, MINIWDL__AWS__WORKFLOW_QUEUE, MINIWDL__AWS__TASK_QUEUE)",
-            file=sys.stderr,
-        )
-        sys.exit(1)
-    args.image = args.image if args.image else os.environ.get("MINIWDL__AWS__WORKFLOW_IMAGE", None)
-    if not args.image:
-        import importlib_metadata
+    parser.add_argument("--self-test", action="store_true", help="perform `miniwdl run_self_test`")
+    return parser
 
-        try:
-            args.image = "ghcr.io/miniwdl-ext/miniwdl-aws:v" + importlib_metadata.version(
-                "miniwdl-aws"
-            )
-        except importlib_metadata.PackageNotFoundError:
-            print(
-                "Failed to detect miniwdl Docker image version tag; set explicitly with --image or MINIWDL__AWS__WORKFLOW_IMAGE",
-                file=sys.stderr,
-            )
-            sys.exit(1)
-    if args.delete_after and not args.s3upload:
-        print("--delete-after requires --s3upload", file=sys.stderr)
-        sys.exit(1)
-    args.s3upload = (
-        args.s3upload if args.s3upload else os.environ.get("MINIWDL__AWS__S3_UPLOAD_FOLDER", None)
-    )
-    args.delete_after = (
-        args.delete_after.strip().lower()
-        if args.delete_after
-        else os.environ.get("MINIWDL__AWS__DELETE_AFTER_S3_UPLOAD", None)
-    )
 
-    return (args, unused_args)
+@functools.lru_cache(maxsize=None)
+def default_image():
+    """
+    miniwdl-aws Docker image tag corresponding to the installed package version (memoized since
+    reading package metadata entails scanning site-packages)
+    """
+    import importlib_metadata
+
+    try:
+        return "ghcr.io/miniwdl-ext/miniwdl-aws:v" + importlib_metadata.version("miniwdl-aws")
+    except importlib_metadata.PackageNotFoundError:
+        return None
 
 
 def form_miniwdl_run_cmd(args, unused_args):
@@ -276,7 +405,7 @@ def form_miniwdl_run_cmd(args, unused_args):
     """
     if args.self_test:
         self_test_dir = os.path.join(
-            args.mount, "miniwdl_run_self_test", datetime.today().strftime("%Y%m%d_%H%M%S")
+            args.mount, "miniwdl_run_self_test", time.strftime("%Y%m%d_%H%M%S")
         )
         miniwdl_run_cmd = ["miniwdl", "run_self_test", "--dir", self_test_dir]
         job_name = args.name if args.name else "miniwdl_run_self_test"
@@ -288,12 +417,10 @@ def form_miniwdl_run_cmd(args, unused_args):
         job_name = args.name
         if not job_name:
             job_name = os.path.basename(wdl_filename).lstrip(".")
-            try:
-                for punct in (".", "?"):
-                    if job_name.index(punct) > 0:
-                        job_name = job_name[: job_name.index(punct)]
-            except ValueError:
-                pass
+            # truncate at the first "." or "?" (e.g. filename extension or URL query string)
+            punct = _JOB_NAME_STOP.search(job_name, 1)
+            if punct:
+                job_name = job_name[: punct.start()]
             job_name = ("miniwdl_run_" + job_name)[:128]
         # pass most arguments through to miniwdl-run-s3upload inside workflow job
         miniwdl_run_cmd = ["miniwdl-run-s3upload"] + unused_args
@@ -303,6 +430,10 @@ def form_miniwdl_run_cmd(args, unused_args):
     return (job_name, miniwdl_run_cmd)
 
 
+# memoized results of detect_workflow_role: (region, workflow queue) => role ARN
+_WORKFLOW_ROLES = {}
+
+
 def detect_workflow_role(aws_batch, workflow_queue, verbose=False):
     """
     With Fargate Batch, we need to specify an IAM role for the workflow job at submission time.
@@ -312,72 +443,116 @@ def detect_workflow_role(aws_batch, workflow_queue, verbose=False):
     WorkflowEngineRoleArn tag on the job queue. Infra provisioning (CloudFormation, Terraform,
     etc.) can set this tag as a convenience.
     """
+    key = (aws_batch.meta.region_name, workflow_queue)
+    if key in _WORKFLOW_ROLES:
+        return _WORKFLOW_ROLES[key]
     try:
-        workflow_role = aws_batch.describe_job_queues(jobQueues=[workflow_queue])["jobQueues"][0][
-            "tags"
-        ]["WorkflowEngineRoleArn"]
-        if verbose:
-            print(
-                "Workflow engine IAM role (from WorkflowEngineRoleArn tag of workflow queue): "
-                + workflow_role,
-                file=sys.stderr,
+        tags = None
+        if workflow_queue.startswith("arn:"):
+            # given the queue ARN, we can fetch just its tags (if permitted)
+            try:
+                tags = aws_batch.list_tags_for_resource(resourceArn=workflow_queue).get("tags", {})
+            except botocore.exceptions.ClientError as exn:
+                if exn.response.get("Error", {}).get("Code") not in (
+                    "AccessDeniedException",
+                    "AccessDenied",
+                ):
+                    raise
+        if tags is None:
+            tags = aws_batch.describe_job_queues(jobQueues=[workflow_queue])["jobQueues"][0].get(
+                "tags"
             )
-        assert workflow_role.startswith("arn:aws:iam::")
-        return workflow_role
-    except:
+        workflow_role = (tags or {})["WorkflowEngineRoleArn"]
+    except (
+        KeyError,
+        IndexError,
+        botocore.exceptions.BotoCoreError,
+        botocore.exceptions.ClientError,
+    ):
         print(
             "Unable to read ARN of workflow engine IAM role from WorkflowEngineRoleArn tag of workflow job queue."
             " Double-check --workflow-queue, or set --workflow-role or environment MINIWDL__AWS__WORKFLOW_ROLE.",
             file=sys.stderr,
         )
         sys.exit(1)
+    if verbose:
+        print(
+            "Workflow engine IAM role (from WorkflowEngineRoleArn tag of workflow queue): "
+            + workflow_role,
+            file=sys.stderr,
+        )
+    if not workflow_role.startswith("arn:aws:iam::"):
+        print(
+            "WorkflowEngineRoleArn tag of workflow job queue does not look like an IAM role ARN: "
+            + workflow_role,
+            file=sys.stderr,
+        )
+        sys.exit(1)
+    _WORKFLOW_ROLES[key] = workflow_role
+    return workflow_role
+
 
+POLL_INTERVAL_MAX = 30.0
 
-def wait(aws_region_name, aws_batch, workflow_job_id, follow):
+
+def wait(boto_session, aws_batch, workflow_job_id, follow, poll_interval=1.0, live_tail=False):
     """
-    Wait for workflow job to complete & return its exit code; optionally tail its log to stderr
+    Wait for workflow job to complete & return its exit code; optionally tail its log to stderr.
+    The DescribeJobs interval doubles (up to POLL_INTERVAL_MAX) while the job status is unchanged,
+    and resets upon a status change or the end-of-log marker. New log messages are still printed
+    every poll_interval.
     """
+    log_follower = None
     try:
-        log_follower = None
         exit_code = None
         saw_end = False
-        while exit_code is None:
-            time.sleep(1.0)
-            job_descs = aws_batch.describe_jobs(jobs=[workflow_job_id])
-            job_desc = job_descs["jobs"][0]
-            if (
-                not log_follower
-                and "container" in job_desc
-                and "logStreamName" in job_desc["container"]
-            ):
-                log_stream_name = job_desc["container"]["logStreamName"]
-                print("Log stream: " + log_stream_name, file=sys.stderr)
-                sys.stderr.flush()
-                log_follower = CloudWatchLogsFollower(
-                    boto3.DEFAULT_SESSION, aws_region_name, "/aws/batch/job", log_stream_name
-                )
-            if follow and log_follower:
-                for event in log_follower.new_events():
-                    if END_OF_LOG not in event["message"]:
-                        print(event["message"], file=sys.stderr)
-                    else:
-                        saw_end = True
-                sys.stderr.flush()
-            if job_desc["status"] == "SUCCEEDED":
-                exit_code = 0
-            elif job_desc["status"] == "FAILED":
-                exit_code = -1
-                if "container" in job_desc and "exitCode" in job_desc["container"]:
-                    exit_code = job_desc["container"]["exitCode"]
-                    assert exit_code != 0
+        status = None
+        interval = poll_interval
+        last_describe = time.monotonic()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            while exit_code is None:
+                time.sleep(poll_interval if follow and log_follower else interval)
+                job_descs = None
+                if saw_end or time.monotonic() - last_describe >= interval:
+                    # request job description, while concurrently printing new log messages
+                    job_descs = executor.submit(aws_batch.describe_jobs, jobs=[workflow_job_id])
+                    last_describe = time.monotonic()
+                    interval = min(POLL_INTERVAL_MAX, interval * 2)
+                if follow and log_follower:
+                    saw_end = print_log_events(log_follower, saw_end)
+                if not job_descs:
+                    continue
+                job_desc = job_descs.result()["jobs"][0]
+                if job_desc["status"] != status:
+                    status = job_desc["status"]
+                    interval = poll_interval
+                if (
+                    not log_follower
+                    and "container" in job_desc
+                    and "logStreamName" in job_desc["container"]
+                ):
+                    log_stream_name = job_desc["container"]["logStreamName"]
+                    print("Log stream: " + log_stream_name, file=sys.stderr)
+                    sys.stderr.flush()
+                    log_follower = follow_log_stream(
+                        boto_session, "/aws/batch/job", log_stream_name, live=follow and live_tail
+                    )
+                    if follow:
+                        saw_end = print_log_events(log_follower, saw_end)
+                if job_desc["status"] == "SUCCEEDED":
+                    exit_code = 0
+                elif job_desc["status"] == "FAILED":
+                    exit_code = -1
+                    if "container" in job_desc and "exitCode" in job_desc["container"]:
+                        exit_code = job_desc["container"]["exitCode"]
+                        assert exit_code != 0
         if follow and log_follower and not saw_end:
-            # give straggler log messages a few seconds to appear
-            time.sleep(3.0)
-            for event in log_follower.new_events():
-                if END_OF_LOG not in event["message"]:
-                    print(event["message"], file=sys.stderr)
-                else:
-                    saw_end = True
+            # collect messages logged while we awaited the final job description, then give
+            # straggler log messages a few seconds to appear
+            saw_end = print_log_events(log_follower, saw_end)
+            if not saw_end:
+                time.sleep(3.0)
+                saw_end = print_log_events(log_follower, saw_end)
             if not saw_end:
                 print(
                     f"[miniwdl-aws-submit] WARNING: end-of-log marker not seen; more information may appear in log stream {log_stream_name}",
@@ -393,6 +568,25 @@ def wait(aws_region_name, aws_batch, workflow_job_id, follow):
             file=sys.stderr,
         )
         return -1
+    finally:
+        if log_follower:
+            log_follower.close()
+
+
+def print_log_events(log_follower, saw_end=False):
+    """
+    Print new log messages to standard error, returning whether the end-of-log marker has been seen
+    """
+    printed = False
+    for event in log_follower.new_events():
+        printed = True
+        if END_OF_LOG not in event["message"]:
+            print(event["message"], file=sys.stderr)
+        else:
+            saw_end = True
+    if printed:
+        sys.stderr.flush()
+    return saw_end
 
 
 class CloudWatchLogsFollower:
@@ -404,13 +598,37 @@ class CloudWatchLogsFollower:
         self.group_name = group_name
         self.stream_name = stream_name
         self._newest_timestamp = None
-        self._newest_event_ids = set()
+        self._newest_event_ids = frozenset()
         self._client = boto_session.client("logs", region_name=region_name)
+        self._stream_exists = not stream_name
+
+    def close(self):
+        pass
 
     def new_events(self):
-        event_ids_per_timestamp = defaultdict(set)
+        if not self._stream_exists:
+            # we may learn the Batch job's log stream name before it actually exists; check that
+            # it does before filtering it
+            try:
+                streams = self._client.describe_log_streams(
+                    logGroupName=self.group_name, logStreamNamePrefix=self.stream_name, limit=1
+                )["logStreams"]
+            except self._client.exceptions.ResourceNotFoundException:
+                return
+            except botocore.exceptions.ClientError:
+                # e.g. not permitted to DescribeLogStreams; skip the check, relying on the
+                # ResourceNotFoundException handling of FilterLogEvents below
+                pass
+            else:
+                if not (streams and streams[0]["logStreamName"] == self.stream_name):
+                    return
+            self._stream_exists = True
+
+        # newest timestamp seen and the IDs of the events we've seen with that timestamp
+        newest_timestamp = self._newest_timestamp or 0
+        newest_event_ids = set(self._newest_event_ids)
 
-        filter_args = {"logGroupName": self.group_name}
+        filter_args = {"logGroupName": self.group_name, "limit": 10000}  # (max page size)
         if self.stream_name:
             filter_args["logStreamNames"] = [self.stream_name]
         if self._newest_timestamp:
@@ -419,7 +637,7 @@ class CloudWatchLogsFollower:
             try:
                 response = self._client.filter_log_events(**filter_args)
             except self._client.exceptions.ResourceNotFoundException:
-                return  # we may learn the Batch job's log stream name before it actually exists
+                return
             for event in response["events"]:
                 # For the case where we've hit the last page, we will be
                 # reusing the newest timestamp of the received events to keep polling.
@@ -427,13 +645,144 @@ class CloudWatchLogsFollower:
                 # are returned back which we do not want to yield again.
                 # We only want to yield log events that we have not seen.
                 if event["eventId"] not in self._newest_event_ids:
-                    event_ids_per_timestamp[event["timestamp"]].add(event["eventId"])
+                    if event["timestamp"] > newest_timestamp:
+                        newest_timestamp = event["timestamp"]
+                        newest_event_ids = {event["eventId"]}
+                    elif event["timestamp"] == newest_timestamp:
+                        newest_event_ids.add(event["eventId"])
                     yield event
             if "nextToken" in response:
                 filter_args["nextToken"] = response["nextToken"]
             else:
                 break
 
-        if event_ids_per_timestamp:
-            self._newest_timestamp = max(event_ids_per_timestamp.keys())
-            self._newest_event_ids = event_ids_per_timestamp[self._newest_timestamp]
+        if newest_event_ids:
+            self._newest_timestamp = newest_timestamp
+            self._newest_event_ids = frozenset(newest_event_ids)
+
+
+def follow_log_stream(boto_session, group_name, stream_name, live=False):
+    """
+    Start following the log stream; through a CloudWatch Logs Live Tail session if live=True and
+    possible, otherwise by polling FilterLogEvents.
+    """
+    if live:
+        try:
+            return CloudWatchLogsLiveTail(
+                boto_session, boto_session.region_name, group_name, stream_name
+            )
+        except (
+            LiveTailUnavailable,
+            botocore.exceptions.BotoCoreError,
+            botocore.exceptions.ClientError,
+        ) as exn:
+            # e.g. not permitted (AccessDeniedException)
+            print(
+                f"[miniwdl-aws-submit] Live Tail unavailable ({exn}); polling log stream instead",
+                file=sys.stderr,
+            )
+    return CloudWatchLogsFollower(boto_session, boto_session.region_name, group_name, stream_name)
+
+
+class LiveTailUnavailable(Exception):
+    pass
+
+
+class CloudWatchLogsLiveTail(CloudWatchLogsFollower):
+    """
+    Follows a log stream through a CloudWatch Logs Live Tail session, in which the service pushes
+    new events to our background thread, instead of polling FilterLogEvents. Events logged before
+    the session started are backfilled using FilterLogEvents, as are any after the session ends
+    (e.g. upon its time limit, or if the service starts sampling the events because they're too
+    numerous).
+    """
+
+    BACKFILL_OVERLAP_MS = 300000  # window before session start to check for duplicate events
+
+    def __init__(self, boto_session, region_name, group_name, stream_name):
+        super().__init__(boto_session, region_name, group_name, stream_name)
+        if not hasattr(self._client, "start_live_tail"):
+            raise LiveTailUnavailable("not supported by the installed boto3; upgrade it")
+        # Live Tail needs the log group ARN
+        groups = self._client.describe_log_groups(logGroupNamePrefix=group_name)["logGroups"]
+        group_arn = next(
+            (group["arn"] for group in groups if group["logGroupName"] == group_name), None
+        )
+        if not group_arn:
+            raise LiveTailUnavailable("log group not found: " + group_name)
+        if group_arn.endswith(":*"):
+            group_arn = group_arn[:-2]
+        self._session_start = int(time.time() * 1000)
+        self._response = self._client.start_live_tail(
+            logGroupIdentifiers=[group_arn], logStreamNames=[stream_name]
+        )
+        self._queue = queue.Queue()
+        self._live = True
+        # Live Tail events don't have IDs, so we detect duplicates by counting (timestamp, message)
+        # occurrences: of the backfilled events near the session start (which live events may
+        # repeat), then of the live events with the newest timestamp (which events polled after
+        # the session ends may repeat)
+        self._overlap = None
+        self._live_newest_timestamp = None
+        self._live_newest = collections.Counter()
+        threading.Thread(target=self._receive, daemon=True).start()
+
+    def _receive(self):
+        try:
+            for item in self._response["responseStream"]:
+                update = item.get("sessionUpdate", {})
+                if update.get("sessionMetadata", {}).get("sampled", False):
+                    # the service is sampling (dropping) events; discard this update and end the
+                    # session, so that its events are backfilled by polling
+                    break
+                for event in update.get("sessionResults", []):
+                    self._queue.put(event)
+        except Exception:
+            pass
+        finally:
+            self._queue.put(None)  # session ended
+            self.close()
+
+    def close(self):
+        try:
+            self._response["responseStream"].close()
+        except Exception:
+            pass
+
+    def new_events(self):
+        if self._overlap is None:
+            self._overlap = collections.Counter()
+            for event in super().new_events():
+                if event["timestamp"] >= self._session_start - self.BACKFILL_OVERLAP_MS:
+                    self._overlap[(event["timestamp"], event["message"])] += 1
+                yield event
+        while self._live:
+            try:
+                event = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if event is None:
+                self._live = False
+                if self._live_newest_timestamp:
+                    # resume polling from the newest timestamp seen live, skipping the events with
+                    # that timestamp we've already yielded
+                    self._newest_timestamp = self._live_newest_timestamp
+                    self._newest_event_ids = frozenset()
+                    self._overlap = self._live_newest
+                break
+            key = (event["timestamp"], event["message"])
+            if self._overlap[key] > 0:
+                self._overlap[key] -= 1
+                continue
+            if event["timestamp"] > (self._live_newest_timestamp or 0):
+                self._live_newest_timestamp = event["timestamp"]
+                self._live_newest = collections.Counter()
+            if event["timestamp"] == self._live_newest_timestamp:
+                self._live_newest[key] += 1
+            yield event
+        for event in super().new_events():
+            key = (event["timestamp"], event["message"])
+            if self._overlap[key] > 0:
+                self._overlap[key] -= 1
+                continue
+            yield event
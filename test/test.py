@@ -98,6 +98,62 @@ def test_miniwdl_run_self_test(aws_batch):
     )
 
 
+def test_job_definition(aws_batch):
+    """
+    Submit the workflow job using an existing job definition (which must set the image, role, EFS
+    volume, and network configuration) via MINIWDL__AWS__WORKFLOW_JOBDEF
+    """
+    region_name = os.environ["AWS_DEFAULT_REGION"]
+    fsap_id = os.environ["MINIWDL__AWS__FSAP"]
+    fs_id = boto3.client("efs", region_name=region_name).describe_access_points(
+        AccessPointId=fsap_id
+    )["AccessPoints"][0]["FileSystemId"]
+    workflow_role = os.environ.get("MINIWDL__AWS__WORKFLOW_ROLE", None)
+    if not workflow_role:
+        workflow_role = aws_batch.describe_job_queues(
+            jobQueues=[os.environ["MINIWDL__AWS__WORKFLOW_QUEUE"]]
+        )["jobQueues"][0]["tags"]["WorkflowEngineRoleArn"]
+    job_def = aws_batch.register_job_definition(
+        jobDefinitionName="miniwdl_aws_test_job_definition",
+        platformCapabilities=["FARGATE"],
+        type="container",
+        containerProperties={
+            "fargatePlatformConfiguration": {"platformVersion": "1.4.0"},
+            "executionRoleArn": workflow_role,
+            "jobRoleArn": workflow_role,
+            "resourceRequirements": [
+                {"type": "VCPU", "value": "2"},
+                {"type": "MEMORY", "value": "4096"},
+            ],
+            "volumes": [
+                {
+                    "name": "efs",
+                    "efsVolumeConfiguration": {
+                        "fileSystemId": fs_id,
+                        "transitEncryption": "ENABLED",
+                        "authorizationConfig": {"accessPointId": fsap_id},
+                    },
+                }
+            ],
+            "mountPoints": [{"containerPath": "/mnt/efs", "sourceVolume": "efs"}],
+            "image": os.environ["MINIWDL__AWS__WORKFLOW_IMAGE"],
+            "networkConfiguration": {"assignPublicIp": "ENABLED"},
+        },
+    )
+    job_def_handle = f"{job_def['jobDefinitionName']}:{job_def['revision']}"
+    env = dict(os.environ)
+    env["MINIWDL__AWS__WORKFLOW_JOBDEF"] = job_def_handle
+    try:
+        subprocess.run(
+            ["python3", "-m", "miniwdl_aws", "--follow", "--self-test", "--no-cache"],
+            cwd=os.path.dirname(os.path.dirname(__file__)),
+            check=True,
+            env=env,
+        )
+    finally:
+        aws_batch.deregister_job_definition(jobDefinition=job_def_handle)
+
+
 @pytest.fixture(scope="session")
 def test_s3_folder():
     """